@@ -6,22 +6,50 @@ Gera datasets JSON em /data/json a partir dos arquivos .xlsx em /data/raw.
 
 Objetivo: rodar no GitHub Actions (sem depender do seu notebook).
 Observação: isso é para estudo/auditoria estatística; não “prevê” resultados de loteria.
+
+Leitura via python-calamine é opt-in (BUILD_DATA_CALAMINE=1): é mais rápida, mas o
+calamine devolve valores tipados e o texto numérico sai normalizado ("04" -> "4",
+"1E-3" -> "0.001", erros como #N/A -> vazio). O padrão é o parser XML, que preserva
+o texto exato de cada célula.
 """
 
 from __future__ import annotations
 
 import datetime as _dt
+import hashlib
 import json
+import os
 import re
+import sys
 import unicodedata
 import zipfile
 import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+try:
+    import orjson
+except ImportError:  # opcional: cai no json da stdlib
+    orjson = None
+
+try:
+    from python_calamine import CalamineError, CalamineWorkbook
+except ImportError:  # opcional: só usado com BUILD_DATA_CALAMINE=1
+    CalamineWorkbook = None
+
 
 RAW_DIR = Path("data/raw")
 OUT_DIR = Path("data/json")
+USE_CALAMINE = os.environ.get("BUILD_DATA_CALAMINE") == "1"
+
+_NUM_COL_RE = re.compile(r"^(?:Bola|Trevo|Coluna)\s*\d+$", re.IGNORECASE)
+_CELLREF_RE = re.compile(r"[A-Z]+")
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
 
 
 # -----------------------------
@@ -31,13 +59,25 @@ def utc_now_iso() -> str:
     return _dt.datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
 
 
+def write_json(path: Path, data) -> None:
+    if orjson is not None:
+        try:
+            path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+            return
+        except orjson.JSONEncodeError:
+            pass  # valor que o orjson recusa (ex.: int fora de 64 bits): usa a stdlib
+    # json.dump grava via iterencode, pedaço a pedaço, sem montar a string inteira
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
 def slugify(text: str) -> str:
-    text = unicodedata.normalize("NFKD", text)
-    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    if not text.isascii():
+        # remove só os acentos (combining); outras letras não-ASCII viram separador
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
     text = text.lower()
-    text = re.sub(r"[^a-z0-9]+", "-", text)
-    text = re.sub(r"-{2,}", "-", text).strip("-")
-    return text or "dataset"
+    return _SLUG_RE.sub("-", text).strip("-") or "dataset"
 
 
 def to_int(v) -> Optional[int]:
@@ -50,8 +90,9 @@ def to_int(v) -> Optional[int]:
     if isinstance(v, float) and v.is_integer():
         return int(v)
     if isinstance(v, str):
-        s = v.strip()
-        if re.fullmatch(r"\d+", s):
+        # as linhas já chegam sem espaços; o strip só roda se o caminho rápido falhar
+        s = v if v.isdigit() else v.strip()
+        if s.isascii() and s.isdigit():
             return int(s)
     return None
 
@@ -77,27 +118,21 @@ def clean_headers(headers: List[Optional[str]]) -> List[Optional[str]]:
 
 
 def extract_number_columns(headers: List[Optional[str]]) -> List[str]:
-    patterns = [
-        re.compile(r"^Bola\s*\d+$", re.I),
-        re.compile(r"^Bola\d+$", re.I),
-        re.compile(r"^Trevo\s*\d+$", re.I),
-        re.compile(r"^Trevo\d+$", re.I),
-        re.compile(r"^Coluna\s*\d+$", re.I),
-        re.compile(r"^Coluna\d+$", re.I),
-    ]
-    cols: List[str] = []
-    for h in headers:
-        if not h:
-            continue
-        hs = str(h).strip()
-        if any(p.match(hs) for p in patterns):
-            cols.append(hs)
-    return cols
+    return [str(h).strip() for h in headers if h and _NUM_COL_RE.match(str(h).strip())]
 
 
 # -----------------------------
 # XLSX (parser tolerante via XML)
 # -----------------------------
+def _ns_prefix(tag: str) -> str:
+    """
+    Prefixo de namespace de uma tag ("{uri}" no ElementTree, "uri}" no expat, ou "").
+    Lido uma vez do elemento raiz, evita o casamento curinga "{*}" a cada elemento.
+    """
+    return tag[: tag.rfind("}") + 1]
+
+
+@lru_cache(maxsize=4096)
 def _col_to_index(col_letters: str) -> int:
     col_letters = col_letters.upper()
     idx = 0
@@ -108,29 +143,61 @@ def _col_to_index(col_letters: str) -> int:
 
 def _parse_shared_strings(zf: zipfile.ZipFile) -> List[str]:
     try:
-        xml_data = zf.read("xl/sharedStrings.xml")
+        stream = zf.open("xl/sharedStrings.xml")
     except KeyError:
         return []
-    root = ET.fromstring(xml_data)
+
+    # expat direto (sem DOM): junta o texto dos <t> de cada <si>
     strings: List[str] = []
-    for si in root.findall(".//{*}si"):
-        parts: List[str] = []
-        for tnode in si.findall(".//{*}t"):
-            if tnode.text:
-                parts.append(tnode.text)
-        strings.append("".join(parts))
+    parts: List[str] = []
+    in_t = False
+    si_name = t_name = None
+
+    def start(name: str, attrs) -> None:
+        nonlocal parts, in_t, si_name, t_name
+        if si_name is None:
+            ns = _ns_prefix(name)
+            si_name, t_name = ns + "si", ns + "t"
+        if name == si_name:
+            parts = []
+        elif name == t_name:
+            in_t = True
+
+    def end(name: str) -> None:
+        nonlocal in_t
+        if name == t_name:
+            in_t = False
+        elif name == si_name:
+            # intern: headers e valores repetidos passam a ser o mesmo objeto
+            strings.append(sys.intern("".join(parts)))
+
+    def chars(data: str) -> None:
+        if in_t:
+            parts.append(data)
+
+    parser = expat.ParserCreate(namespace_separator="}")
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = chars
+    with stream:
+        parser.ParseFile(stream)
     return strings
 
 
 def _first_sheet_path(zf: zipfile.ZipFile) -> str:
-    wb = ET.fromstring(zf.read("xl/workbook.xml"))
-    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    with zf.open("xl/workbook.xml") as f:
+        wb = ET.parse(f).getroot()
+    with zf.open("xl/_rels/workbook.xml.rels") as f:
+        rels = ET.parse(f).getroot()
 
+    rns = _ns_prefix(rels.tag)
     rid_to_target: Dict[str, str] = {}
-    for rel in rels.findall(".//{*}Relationship"):
+    for rel in rels.iter(rns + "Relationship"):
         rid_to_target[rel.attrib.get("Id")] = rel.attrib.get("Target", "")
 
-    sheet = wb.find(".//{*}sheets/{*}sheet")
+    ns = _ns_prefix(wb.tag)
+    sheet = wb.find(f"{ns}sheets/{ns}sheet")
     if sheet is None:
         raise RuntimeError("Não achei nenhuma sheet no workbook.xml")
 
@@ -147,57 +214,142 @@ def _first_sheet_path(zf: zipfile.ZipFile) -> str:
     return target
 
 
+_EXCEL_EPOCH = _dt.datetime(1899, 12, 30)
+
+
+def _calamine_cell(v) -> Optional[str]:
+    """
+    Converte o valor tipado do calamine em texto. Não é o <v> original: o calamine não
+    expõe o texto bruto, então números saem normalizados ("04" -> "4") e células de
+    erro viram None.
+    """
+    if v is None or v == "":
+        return None
+    if isinstance(v, str):
+        return v
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, float):
+        return str(int(v)) if v.is_integer() else repr(v)
+    if isinstance(v, int):
+        return str(v)
+    # datas voltam ao número serial do Excel, como no <v> da planilha
+    if isinstance(v, _dt.datetime):
+        serial = (v - _EXCEL_EPOCH).total_seconds() / 86400
+    elif isinstance(v, _dt.date):
+        serial = (v - _EXCEL_EPOCH.date()).days
+    elif isinstance(v, _dt.time):
+        serial = (v.hour * 3600 + v.minute * 60 + v.second + v.microsecond / 1e6) / 86400
+    elif isinstance(v, _dt.timedelta):
+        serial = v.total_seconds() / 86400
+    else:
+        return str(v)
+    return _calamine_cell(float(serial))
+
+
+def _read_first_sheet_rows_calamine(xlsx_path: Path) -> List[List[Optional[str]]]:
+    sheet = CalamineWorkbook.from_path(str(xlsx_path)).get_sheet_by_index(0)
+    rows: List[List[Optional[str]]] = []
+    for raw in sheet.to_python(skip_empty_area=False):
+        row = [_calamine_cell(v) for v in raw]
+        if not rows and all(v is None for v in row):
+            # ignora “linhas” vazias antes do header
+            continue
+        rows.append(row)
+    return rows
+
+
 def read_first_sheet_rows(xlsx_path: Path) -> List[List[Optional[str]]]:
     """
     Lê a primeira aba do XLSX como matriz de strings (tolerante a arquivos “estranhos”).
+    Por padrão usa o parser XML em streaming; com BUILD_DATA_CALAMINE=1 usa o
+    python-calamine (Rust), que normaliza o texto numérico (ver docstring do módulo).
     """
+    if USE_CALAMINE:
+        if CalamineWorkbook is None:
+            raise RuntimeError("BUILD_DATA_CALAMINE=1, mas o python-calamine não está instalado.")
+        try:
+            return _read_first_sheet_rows_calamine(xlsx_path)
+        except CalamineError:
+            pass  # arquivo que o calamine recusa: tenta o parser tolerante
+    return _read_first_sheet_rows_xml(xlsx_path)
+
+
+def _read_first_sheet_rows_xml(xlsx_path: Path) -> List[List[Optional[str]]]:
     with zipfile.ZipFile(xlsx_path) as zf:
         shared = _parse_shared_strings(zf)
         sheet_path = _first_sheet_path(zf)
-        root = ET.fromstring(zf.read(sheet_path))
 
         rows: List[List[Optional[str]]] = []
-        global_max_col = 0
-
-        for row_el in root.findall(".//{*}sheetData/{*}row"):
-            cells: Dict[int, Optional[str]] = {}
-            cur_col = 0
-
-            for c in row_el.findall("{*}c"):
-                ref = c.attrib.get("r")
-                if ref:
-                    m = re.match(r"([A-Z]+)(\d+)", ref)
-                    if m:
-                        cur_col = _col_to_index(m.group(1))
-
-                col_idx = cur_col
-                cur_col += 1
-
-                t = c.attrib.get("t")
-                v_el = c.find("{*}v")
-                value: Optional[str] = None
-
-                if t == "s":
-                    if v_el is not None and v_el.text is not None:
-                        si = int(v_el.text)
-                        value = shared[si] if 0 <= si < len(shared) else v_el.text
-                elif t == "inlineStr":
-                    t_el = c.find(".//{*}t")
-                    value = t_el.text if t_el is not None else None
-                else:
-                    value = v_el.text if v_el is not None else None
-
-                cells[col_idx] = value
-                global_max_col = max(global_max_col, col_idx)
-
-            if not cells and not rows:
-                # ignora “linhas” vazias antes do header
-                continue
-
-            row = [None] * (global_max_col + 1)
-            for idx, val in cells.items():
-                row[idx] = val
-            rows.append(row)
+        sheet_data = None
+        ns = None
+
+        # streaming: cada <row> é processada e descartada, sem montar o DOM da sheet inteira
+        with zf.open(sheet_path) as stream:
+            for event, row_el in ET.iterparse(stream, events=("start", "end")):
+                if event == "start":
+                    if ns is None:
+                        # raiz <worksheet>: fixa as tags já com o namespace do arquivo
+                        ns = _ns_prefix(row_el.tag)
+                        sheet_data_tag, row_tag = ns + "sheetData", ns + "row"
+                        c_tag, v_tag = ns + "c", ns + "v"
+                        is_t_path, is_rt_path = f"{ns}is/{ns}t", f"{ns}is/{ns}r/{ns}t"
+                    elif sheet_data is None and row_el.tag == sheet_data_tag:
+                        sheet_data = row_el
+                    continue
+                if sheet_data is None or row_el.tag != row_tag:
+                    continue
+
+                row_list: List[Optional[str]] = []
+                cur_col = 0
+
+                for c in row_el.iterfind(c_tag):
+                    ref = c.attrib.get("r")
+                    if ref:
+                        m = _CELLREF_RE.match(ref)
+                        if m:
+                            cur_col = _col_to_index(m.group())
+
+                    col_idx = cur_col
+                    cur_col += 1
+
+                    t = c.attrib.get("t")
+                    v_el = c.find(v_tag)
+                    value: Optional[str] = None
+
+                    if t == "s":
+                        txt = v_el.text if v_el is not None else None
+                        if txt is not None:
+                            try:
+                                si = int(txt)
+                                value = shared[si] if si >= 0 else txt
+                            except (IndexError, ValueError):
+                                value = txt
+                    elif t == "inlineStr":
+                        t_el = c.find(is_t_path)
+                        if t_el is None:
+                            # rich text: <is><r><t>
+                            t_el = c.find(is_rt_path)
+                        value = t_el.text if t_el is not None else None
+                    else:
+                        value = v_el.text if v_el is not None else None
+
+                    if col_idx >= len(row_list):
+                        row_list.extend([None] * (col_idx - len(row_list)))
+                        row_list.append(value)
+                    else:
+                        # célula fora de ordem/repetida: sobrescreve como antes
+                        row_list[col_idx] = value
+
+                # a <row> já foi consumida: solta os elementos lidos até aqui
+                sheet_data.clear()
+
+                if not row_list and not rows:
+                    # ignora “linhas” vazias antes do header
+                    continue
+
+                # largura natural da linha; quem consome ajusta à largura do header
+                rows.append(row_list)
 
         return rows
 
@@ -220,47 +372,39 @@ def parse_xlsx_dataset(xlsx_path: Path) -> Dict:
 
     headers = clean_headers([v if v is None else str(v) for v in header_raw])
     num_cols = extract_number_columns(headers)
+    num_idx = [headers.index(c) for c in num_cols]
 
     draws: List[Dict] = []
+    # números de todos os sorteios, só em memória para as estatísticas;
+    # quem consome o JSON reconstrói a partir de meta.number_columns
+    flat: List[int] = []
 
+    width = len(headers)
     for row in matrix[1:]:
-        row = row[: len(headers)]
-        if not row or all(v is None or str(v).strip() == "" for v in row):
+        # normaliza a linha uma única vez: string sem espaços ou None
+        srow = [None if v is None else (str(v).strip() or None) for v in row[:width]]
+        if len(srow) < width:
+            srow.extend([None] * (width - len(srow)))
+        if not any(srow):
             continue
 
         # se a primeira coluna (geralmente "Concurso") estiver vazia, ignora
-        if row[0] is None or str(row[0]).strip() == "":
+        if srow[0] is None:
             continue
 
-        rec: Dict[str, object] = {}
-
-        for h, v in zip(headers, row):
-            if not h:
-                continue
-            if v is None:
-                continue
-            s = str(v).strip()
-            if s == "":
-                continue
-            rec[h] = s
-
-        # derived numbers
-        nums: List[int] = []
-        for col in num_cols:
-            n = to_int(rec.get(col))
+        rec: Dict[str, object] = {h: v for h, v in zip(headers, srow) if h and v is not None}
+
+        for i in num_idx:
+            n = to_int(srow[i])
             if n is not None:
-                nums.append(n)
-        if nums:
-            rec["__numbers"] = nums
+                flat.append(n)
 
         draws.append(rec)
 
-    counts: Dict[str, int] = {}
-    total_nums = 0
-    for d in draws:
-        for n in d.get("__numbers", []):
-            counts[str(n)] = counts.get(str(n), 0) + 1
-            total_nums += 1
+    # contagem numa única passada em C (Counter); chaves viram str uma vez, no fim
+    # (nada de int arbitrário chegando ao serializador: orjson só aceita 64 bits)
+    total_nums = len(flat)
+    counts: Dict[str, int] = {str(n): c for n, c in Counter(flat).items()}
 
     last_draw = draws[-1] if draws else {}
 
@@ -287,39 +431,97 @@ def parse_xlsx_dataset(xlsx_path: Path) -> Dict:
     return dataset
 
 
+def _previous_meta(out_path: Path) -> Optional[Dict]:
+    """
+    Meta do JSON já gerado (se existir e for legível), para o build incremental.
+    """
+    try:
+        data = json.loads(out_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    meta = data.get("meta") if isinstance(data, dict) else None
+    return meta if isinstance(meta, dict) else None
+
+
+def _build_hash() -> str:
+    """
+    Versão do gerador: hash deste script + backend de leitura. Muda sempre que o
+    parser ou o formato de saída mudam, invalidando os JSON já gerados.
+    """
+    h = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16)
+    h.update(b"calamine" if USE_CALAMINE else b"xml")
+    return h.hexdigest()
+
+
+def _process_one(xlsx_path: Path, out_dir: Path) -> Tuple[Dict, bool]:
+    """
+    Gera o JSON de um .xlsx e devolve a entrada correspondente do manifest.
+    Se o JSON existente já foi gerado a partir do mesmo conteúdo (source_hash) pela
+    mesma versão do gerador (build_hash), reaproveita-o sem reprocessar; o bool indica
+    esse caso.
+    """
+    ds_id = slugify(xlsx_path.stem)
+    out_path = out_dir / f"{ds_id}.json"
+    source_hash = hashlib.blake2b(xlsx_path.read_bytes(), digest_size=16).hexdigest()
+    build_hash = _build_hash()
+
+    meta = _previous_meta(out_path)
+    reused = (
+        meta is not None
+        and meta.get("source_hash") == source_hash
+        and meta.get("build_hash") == build_hash
+    )
+    if not reused:
+        ds = parse_xlsx_dataset(xlsx_path)
+        ds["meta"]["source_hash"] = source_hash
+        ds["meta"]["build_hash"] = build_hash
+        write_json(out_path, ds)
+        meta = ds["meta"]
+
+    entry = {
+        "id": ds_id,
+        "name": xlsx_path.stem,
+        "path": f"data/json/{ds_id}.json",
+        "rows": meta["rows"],
+        "number_columns": meta["number_columns"],
+        "generated_at_utc": meta["generated_at_utc"],
+    }
+    return entry, reused
+
+
 def build_all(raw_dir: Path = RAW_DIR, out_dir: Path = OUT_DIR) -> None:
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    datasets_manifest: List[Dict] = []
     xlsx_files = sorted(p for p in raw_dir.glob("*.xlsx") if p.is_file())
 
     if not xlsx_files:
         raise RuntimeError("Nenhum .xlsx encontrado em data/raw")
 
+    # ids repetidos fariam dois processos gravarem o mesmo JSON ao mesmo tempo
+    by_id: Dict[str, List[str]] = {}
     for xlsx in xlsx_files:
-        ds = parse_xlsx_dataset(xlsx)
-        ds_id = slugify(xlsx.stem)
-        out_path = out_dir / f"{ds_id}.json"
-        out_path.write_text(json.dumps(ds, ensure_ascii=False, indent=2), encoding="utf-8")
-
-        datasets_manifest.append(
-            {
-                "id": ds_id,
-                "name": xlsx.stem,
-                "path": f"data/json/{ds_id}.json",
-                "rows": ds["meta"]["rows"],
-                "number_columns": ds["meta"]["number_columns"],
-                "generated_at_utc": ds["meta"]["generated_at_utc"],
-            }
-        )
-
-        print(f"[OK] {xlsx.name} -> {out_path.as_posix()} ({ds['meta']['rows']} linhas)")
+        by_id.setdefault(slugify(xlsx.stem), []).append(xlsx.name)
+    clashes = {ds_id: names for ds_id, names in by_id.items() if len(names) > 1}
+    if clashes:
+        detail = "; ".join(f"{ds_id}: {', '.join(names)}" for ds_id, names in clashes.items())
+        raise RuntimeError(f"Arquivos .xlsx com o mesmo id de dataset ({detail})")
+
+    # um processo por planilha: o parsing é CPU-bound e preso ao GIL
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+        results = list(ex.map(_process_one, xlsx_files, repeat(out_dir)))
+
+    datasets_manifest: List[Dict] = []
+    for xlsx, (entry, reused) in zip(xlsx_files, results):
+        out_path = out_dir / f"{entry['id']}.json"
+        tag = "SKIP" if reused else "OK"
+        print(f"[{tag}] {xlsx.name} -> {out_path.as_posix()} ({entry['rows']} linhas)")
+        datasets_manifest.append(entry)
 
     manifest = {
         "generated_at_utc": utc_now_iso(),
         "datasets": datasets_manifest,
     }
-    (out_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json(out_dir / "manifest.json", manifest)
     print(f"[OK] manifest.json gerado com {len(datasets_manifest)} datasets.")
 
 